@@ -0,0 +1,57 @@
+import sys
+import time
+from pathlib import Path
+
+parent_dir = Path(__file__).resolve().parent
+src_dir = parent_dir / '../src'
+sys.path.insert(0, str(src_dir))
+
+from corona.comparisons import epidemic_summaries
+from corona.hopkins import get_cases_as_df
+from corona.pipeline import derive_frames, load_settings, \
+    spreadsheets_handler
+from corona.server import DatasetStore, serve_in_background
+
+if len(sys.argv) == 2:
+    settings_ini = Path(sys.argv[1])
+else:
+    settings_ini = parent_dir / 'settings.ini'
+
+print(f"Using settings {settings_ini}")
+if not settings_ini.exists():
+    print("""
+    Couldn't find settings file.
+
+    Usage:
+    serve.py [SETTINGS]
+
+    Serves the Coronavirus dashboard data over HTTP, refreshing it
+    periodically. Host, port and refresh interval (minutes) are read from
+    the optional [SERVER] section of the SETTINGS file.
+
+    """)
+    sys.exit(1)
+
+config = load_settings(settings_ini)
+sheets = spreadsheets_handler(config, api_write=False)
+sheet_ids = config['SPREADSHEETS']
+server_config = config['SERVER'] if 'SERVER' in config else {}
+host = server_config.get('HOST', '127.0.0.1')
+port = int(server_config.get('PORT', 8050))
+refresh_minutes = float(server_config.get('REFRESH_MINUTES', 60))
+
+store = DatasetStore()
+server = serve_in_background(store, host, port)
+print(f"Serving on http://{host}:{port}/")
+
+while True:
+    try:
+        cases_df = get_cases_as_df()
+        epidemic_days = epidemic_summaries(cases_df, sheets.get_spreadsheet(
+            sheet_ids['EXPORT_EPIDEMIC_DAYS']))
+        store.publish(epidemic_days=epidemic_days, **derive_frames(cases_df))
+        print(f"Data refreshed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    except Exception as e:
+        # Keep serving the previous data until the next refresh.
+        print(f"Refresh failed: {e!r}")
+    time.sleep(refresh_minutes * 60)
@@ -1,71 +1,122 @@
-import os
 import sys
-from configparser import ConfigParser
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 parent_dir = Path(__file__).resolve().parent
 src_dir = parent_dir / '../src'
 sys.path.insert(0, str(src_dir))
 
-from corona.comparisons import epidemic_summaries, sars_progress
-from corona.statistics import get_big_numbers
-from corona.epirisk import query_epirisk
-from corona.hopkins import get_cases_as_df
-from corona.spreadsheets import SpreadsheetsHandler
+from corona.comparisons import epidemic_summaries
+from corona.hopkins import get_cases_as_df, stream_us_cases, \
+    copy_us_partitions
+from corona.pipeline import derive_frames, load_settings, \
+    spreadsheets_handler
 
-config = ConfigParser()
-if len(sys.argv) == 2:
-    settings_ini = Path(sys.argv[1])
-else:
-    settings_ini = parent_dir / 'settings.ini'
-
-print(f"Using settings {settings_ini}")
-if settings_ini.exists():
-    config.read('settings.ini')
-else:
-    print("""
+settings_files = [Path(arg) for arg in sys.argv[1:]] or \
+    [parent_dir / 'settings.ini']
+configs = {}
+for settings_ini in settings_files:
+    print(f"Using settings {settings_ini}")
+    if not settings_ini.exists():
+        print("""
     Couldn't find settings file.
     
     Usage:
-    update.py [SETTINGS]
+    update.py [SETTINGS...]
     
-    Updates the Coronavirus dashboard data using the SETTINGS file. 
+    Updates the Coronavirus dashboard data using the SETTINGS files. 
     If SETTINGS not given, tries to load settings.ini in current directory.
+    When several SETTINGS are given, the data is acquired once and exported 
+    to the spreadsheets of every SETTINGS file concurrently.
+    
+    If US_PARTITIONS_DIR is set in the [OUTPUTS] section, the US 
+    county-level series are also streamed into partitions in that directory.
     
     If path to credentials file is not given or empty in the SETTINGS file, 
     tries to read the path from an environment variable 
     (CORONA_READER_CREDENTIALS).
     
     """)
-    sys.exit(1)
-
-credentials_file = config['CREDENTIALS'].get(
-    'CORONA_READER_CREDENTIALS') or os.getenv('CORONA_READER_CREDENTIALS')
-sheets = SpreadsheetsHandler(credentials_file, api_write=True)
-sheet_ids = config['SPREADSHEETS']
+        sys.exit(1)
+    configs[settings_ini] = load_settings(settings_ini)
 
 # Acquire current data
 cases_df = get_cases_as_df()
 
 # Create data for particular Tableau worksheets:
+frames = derive_frames(cases_df)
+
+# Stream the US county-level series once, into the first configured
+# directory; other targets get a copy. A failure is reported for every
+# target which configured it.
+us_dirs = {settings_ini: Path(config['OUTPUTS']['US_PARTITIONS_DIR'])
+           for settings_ini, config in configs.items()
+           if config.has_option('OUTPUTS', 'US_PARTITIONS_DIR')}
+us_partitions_dir = next(iter(us_dirs.values()), None)
+us_error = None
+if us_partitions_dir is not None:
+    try:
+        stream_us_cases(us_partitions_dir)
+    except Exception as e:
+        us_error = e
+
+# Spreadsheet settings and the datasets saved in them. Optional spreadsheets
+# are only written if set in the settings file.
+exports = {
+    'EXPORT_FOR_TABLEAU': 'cases',
+    'EXPORT_FOR_TABLEAU_WITH_SARS': 'cases_with_sars',
+    'EXPORT_CONNECTIONS': 'connections',
+    'EXPORT_RISKS': 'risks',
+    'EXPORT_RISK_CASES': 'risk_cases',
+    'EXPORT_BIG_NUMBERS': 'big_numbers',
+}
+optional_exports = {
+    'EXPORT_PROJECTIONS': 'projections',
+    'EXPORT_EPIDEMICS_ALIGNED': 'epidemics_aligned',
+    'EXPORT_PER_MIL_HISTORY': 'per_mil_history',
+}
 
-# - to compare epidemic progress with SARS:
-final_df, sars_df = sars_progress(cases_df)
-# - to compare parameters of various epidemics:
-epidemic_days = epidemic_summaries(cases_df, sheets.get_spreadsheet(
-    sheet_ids['EXPORT_EPIDEMIC_DAYS']))
-# - to predict how the current epidemic might keep spreading:
-connections_df, distribution_df, exported_df, risk_cases_df = \
-    query_epirisk(cases_df)
-# - to get current statistics
-big_numbers_df = get_big_numbers(cases_df)
 
-# Save data in Google Sheets for Tableau to use:
-sheets.save_df_to_spreadsheet(cases_df, sheet_ids['EXPORT_FOR_TABLEAU'])
-sheets.save_df_to_spreadsheet(epidemic_days, sheet_ids['EXPORT_EPIDEMIC_DAYS'])
-sheets.save_df_to_spreadsheet(final_df, sheet_ids[
-    'EXPORT_FOR_TABLEAU_WITH_SARS'])
-sheets.save_df_to_spreadsheet(connections_df, sheet_ids['EXPORT_CONNECTIONS'])
-sheets.save_df_to_spreadsheet(distribution_df, sheet_ids['EXPORT_RISKS'])
-sheets.save_df_to_spreadsheet(risk_cases_df, sheet_ids['EXPORT_RISK_CASES'])
-sheets.save_df_to_spreadsheet(big_numbers_df, sheet_ids['EXPORT_BIG_NUMBERS'])
+def export(settings_ini, config):
+    """Saves data in Google Sheets configured in config for Tableau to use."""
+    start = time.perf_counter()
+    sheets = spreadsheets_handler(config)
+    sheet_ids = config['SPREADSHEETS']
+
+    # - to compare parameters of various epidemics, using the other
+    # epidemics' data from this target's spreadsheet:
+    epidemic_days = epidemic_summaries(cases_df, sheets.get_spreadsheet(
+        sheet_ids['EXPORT_EPIDEMIC_DAYS']))
+    sheets.save_df_to_spreadsheet(epidemic_days,
+                                  sheet_ids['EXPORT_EPIDEMIC_DAYS'])
+    for sheet_name, dataset in exports.items():
+        sheets.save_df_to_spreadsheet(frames[dataset], sheet_ids[sheet_name])
+    for sheet_name, dataset in optional_exports.items():
+        if sheet_name in sheet_ids:
+            sheets.save_df_to_spreadsheet(frames[dataset],
+                                          sheet_ids[sheet_name])
+    if settings_ini in us_dirs:
+        if us_error is not None:
+            raise RuntimeError(
+                f'Streaming US series failed: {us_error!r}') from us_error
+        out_dir = us_dirs[settings_ini]
+        if out_dir.resolve() != us_partitions_dir.resolve():
+            copy_us_partitions(us_partitions_dir, out_dir)
+    return time.perf_counter() - start
+
+
+with ThreadPoolExecutor(max_workers=len(configs)) as executor:
+    futures = {settings_ini: executor.submit(export, settings_ini, config)
+               for settings_ini, config in configs.items()}
+
+failed = False
+print("Export summary:")
+for settings_ini, future in futures.items():
+    try:
+        print(f"  {settings_ini}: done in {future.result():.1f}s")
+    except Exception as e:
+        failed = True
+        print(f"  {settings_ini}: FAILED: {e!r}")
+if failed:
+    sys.exit(1)
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from importlib import resources
 
@@ -43,6 +44,59 @@ def sars_progress(cases_df):
     concatenated data from cases_df and sars_df.
     """
     sars_df = pd.read_csv(resources.open_text('corona.resources', 'SARS.csv'))
-    del sars_df['Recovered']
     both_df = pd.concat([cases_df, sars_df], ignore_index=True, sort=True)
     return both_df, sars_df
+
+
+def align_epidemic_days(both_df, *, min_cases=100, min_deaths=10):
+    """
+    Aligns epidemics on the number of days since they reached min_cases
+    confirmed cases and min_deaths deaths, per country and for the whole
+    world, so that comparison views don't need to realign them.
+
+    :param both_df: DataFrame with the progress of several epidemics, as
+    returned by sars_progress.
+    Expected columns: 'Epidemy', 'ISO3', 'Date', 'Confirmed', 'Deaths'
+    :param min_cases: number of confirmed cases starting the case count.
+    :param min_deaths: number of deaths starting the death count.
+    :return: DataFrame with columns 'Epidemy', 'ISO3' ('World' for the
+    totals, which also include locations without a country), 'Date', 'Confirmed', 'Deaths', 'DaysSinceCases' and
+    'DaysSinceDeaths'. Only rows since min_cases was reached are kept;
+    'DaysSinceDeaths' is missing before min_deaths was reached.
+    """
+    keys = ['Epidemy', 'ISO3', 'Date']
+    counts = ['Confirmed', 'Deaths']
+    # Unrecognized locations (e.g. cruise ships) count only in world totals.
+    world = both_df.groupby(['Epidemy', 'Date'], as_index=False)[counts].sum()
+    world['ISO3'] = 'World'
+    df = both_df[both_df['ISO3'].notna() & (both_df['ISO3'] != 'Other')]
+    df = df.groupby(keys, as_index=False)[counts].sum()
+    df = pd.concat([df, world], ignore_index=True, sort=False)
+    df = df.sort_values(keys, ignore_index=True)
+
+    groups = df.groupby(keys[:2], sort=False).ngroup().to_numpy()
+    days = pd.to_datetime(df['Date']).to_numpy().astype('datetime64[D]') \
+        .astype(np.int64)
+    df['DaysSinceCases'] = _days_since_crossing(
+        groups, days, df['Confirmed'].to_numpy(float) >= min_cases)
+    df['DaysSinceDeaths'] = _days_since_crossing(
+        groups, days, df['Deaths'].to_numpy(float) >= min_deaths)
+
+    df = df[df['DaysSinceCases'].notna()].reset_index(drop=True)
+    return df.astype({'Confirmed': np.int64, 'Deaths': np.int64,
+                      'DaysSinceCases': 'Int64', 'DaysSinceDeaths': 'Int64'})
+
+
+def _days_since_crossing(groups, days, reached):
+    """
+    Number of days since the first row in the same group where the
+    threshold was reached, NaN before that. Rows must be sorted by group and
+    day.
+    """
+    crossing_day = np.full(groups.max() + 1, np.nan)
+    crossed = np.flatnonzero(reached)
+    crossed_groups, first = np.unique(groups[crossed], return_index=True)
+    crossing_day[crossed_groups] = days[crossed[first]]
+    days_since = days - crossing_day[groups]
+    days_since[days_since < 0] = np.nan
+    return days_since
@@ -3,6 +3,7 @@ from base64 import b64encode
 from dataclasses import dataclass
 from typing import List, Dict, Set
 
+import numpy as np
 import pandas as pd
 import requests
 
@@ -14,6 +15,9 @@ from corona.countries import get_countries_df
 # will be sent to Epirisk. It introduces potencial problems or inconsistencies,
 # as countries with infections could be presented as only still at risk.
 KEEP_TOP_CASES_COUNT = 110
+# Bins of confirmed cases per million inhabitants, used for choropleth maps.
+PER_MIL_BINS = [0, 2, 5, 10, 50, 100, 400, 5000]
+PER_MIL_LABELS = ['0-2', '2-5', '5-10', '10-50', '50-100', '100-400', '>400']
 _months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
            'Oct', 'Nov', 'Dec']
 
@@ -272,16 +276,13 @@ def query_epirisk(cases, *, mute=True):
 
     risk_cases_ratio_df['per_mil'] = risk_cases_ratio_df['Confirmed'].astype(
         float) / risk_cases_ratio_df['population'].astype(float) * 1000000
-    bins = [0, 2, 5, 10, 50, 100, 400, 5000]
-    labels = ['0-2', '2-5', '5-10', '10-50', '50-100', '100-400', '>400']
-
     risk_cases_ratio_df['bin'] = ''
 
     risk_cases_ratio_df = adds_bin_col(risk_cases_ratio_df)
     risk_cases_ratio_df['bin'].where(
         risk_cases_ratio_df.Confirmed.astype(int) == 0,
         pd.cut(risk_cases_ratio_df['per_mil'],
-               bins=bins, labels=labels).astype(str),
+               bins=PER_MIL_BINS, labels=PER_MIL_LABELS).astype(str),
         inplace=True
     )
 
@@ -290,6 +291,46 @@ def query_epirisk(cases, *, mute=True):
     return connections_df, distribution_df, exported, risk_cases_ratio_df
 
 
+def per_mil_history(cases_df):
+    """
+    Computes confirmed cases per million inhabitants and their bin for every
+    country on every date, as query_epirisk does for the most recent date.
+
+    The whole country x date matrix is divided by the population at once and
+    binned with np.digitize, so the cost barely depends on the number of
+    dates.
+
+    :param cases_df: DataFrame with the progress of the Covid-19 epidemic.
+    Expected columns: 'ISO3', 'Confirmed', 'Date'
+    :return: DataFrame with columns 'ISO3', 'Date', 'Confirmed', 'per_mil'
+    and 'bin'. 'bin' is empty for countries without cases and 'nan' where
+    per_mil is out of the bins' range or the population is unknown.
+    """
+    cases = cases_df.pivot_table(index='ISO3', columns='Date',
+                                 values='Confirmed', aggfunc='sum',
+                                 fill_value=0)
+    confirmed = cases.to_numpy(dtype=float)
+    population = get_countries_df(['population'])['population'] \
+        .reindex(cases.index).to_numpy(dtype=float, na_value=np.nan)
+    per_mil = confirmed / population[:, None] * 1000000
+
+    # np.digitize(right=True) matches pd.cut's right-closed intervals; codes
+    # 0 and len(PER_MIL_BINS) are out of range, like NaN in pd.cut.
+    categories = ['nan'] + PER_MIL_LABELS + ['']
+    codes = np.digitize(per_mil, PER_MIL_BINS, right=True)
+    codes[np.isnan(per_mil) | (codes == len(PER_MIL_BINS))] = 0
+    codes[confirmed == 0] = len(categories) - 1
+
+    countries, dates = cases.shape
+    return pd.DataFrame({
+        'ISO3': np.repeat(cases.index.to_numpy(), dates),
+        'Date': np.tile(cases.columns.to_numpy(), countries),
+        'Confirmed': cases.to_numpy(dtype=np.int64).ravel(),
+        'per_mil': per_mil.ravel(),
+        'bin': pd.Categorical.from_codes(codes.ravel(), categories),
+    })
+
+
 def setup_epirisk(cases_df, mute=True):
     """
     Factory method for creating EpiriskQuery objects initiated with the
@@ -1,10 +1,26 @@
-from functools import reduce, partial
+import csv
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import zip_longest
+from pathlib import Path
+from urllib.request import urlopen
+from uuid import uuid4
+import numpy as np
 import pandas as pd
-# How many columns in the time series data, before the time series
-# columns begin.
 from corona.countries import add_ISO3_from_name
 
-_TIMESERIES_FIXED_COLS = 4
+# Columns identifying a location in the time series data. All other columns
+# which parse as dates hold the time series values.
+_LOCATION_COLS = ['Province/State', 'Country/Region', 'Lat', 'Long']
+_US_LOCATION_COLS = ['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2',
+                     'Province_State', 'Country_Region', 'Lat', 'Long_',
+                     'Combined_Key']
+_DATE_FORMAT = '%m/%d/%y'
+# Upper bound of the number of values (rows * columns) held in memory per
+# series when streaming the US files.
+_STREAM_MAX_CELLS = 500000
 
 _URL_PREFIX = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/' \
               'master/csse_covid_19_data/csse_covid_19_time_series/'
@@ -13,26 +29,103 @@ _SERIES = {
         _URL_PREFIX + 'time_series_covid19_confirmed_global.csv',
     'Deaths':
         _URL_PREFIX + 'time_series_covid19_deaths_global.csv',
+    'Recovered':
+        _URL_PREFIX + 'time_series_covid19_recovered_global.csv',
 }
+_US_SERIES = {
+    'Confirmed':
+        _URL_PREFIX + 'time_series_covid19_confirmed_US.csv',
+    'Deaths':
+        _URL_PREFIX + 'time_series_covid19_deaths_US.csv',
+}
+
 
+def _download_series(series):
+    with ThreadPoolExecutor(max_workers=len(series)) as executor:
+        frames = executor.map(pd.read_csv, series.values())
+        return dict(zip(series.keys(), frames))
 
-def _get_category_df(value_name, url):
-    df = pd.read_csv(url)
-    dates = pd.to_datetime(df.columns[_TIMESERIES_FIXED_COLS:],
-                           format='%m/%d/%y')
-    dates = pd.Series(dates).dt.normalize().drop_duplicates(keep='last')
-    df2 = pd.melt(df, id_vars=df.columns[:_TIMESERIES_FIXED_COLS],
-                  value_vars=df.columns[_TIMESERIES_FIXED_COLS + dates.index],
-                  var_name='Date', value_name=value_name)
 
-    df2.dropna(subset=[value_name], inplace=True)
-    df2 = df2[df2[value_name] > 0]
-    df2[value_name] = df2[value_name].astype('Int64')
+def _date_columns(df):
+    """
+    Finds the time series columns of df.
+
+    :return: (positions, dates) tuple; positions of the date columns and the
+    corresponding normalized dates. For repeated dates only the last column
+    is kept.
+    """
+    dates = pd.to_datetime(pd.Series(df.columns), format=_DATE_FORMAT,
+                           errors='coerce')
+    dates = dates.dropna().dt.normalize().drop_duplicates(keep='last')
+    return dates.index.to_numpy(), dates.to_numpy()
+
 
-    df2['Date'] = pd.to_datetime(df2['Date'], format='%m/%d/%y') \
-        .dt.strftime('%Y-%m-%d')
+def _fixed_columns(df):
+    dates = pd.to_datetime(pd.Series(df.columns), format=_DATE_FORMAT,
+                           errors='coerce')
+    return df.columns[dates.isna().to_numpy()]
 
-    return df2
+
+def _location_ids(locations):
+    """
+    Assigns a shared integer id to every distinct location.
+
+    :param locations: DataFrame with location columns, possibly with repeated
+    rows.
+    :return: (ids, first) tuple; ids - location id of each row, first -
+    row position of the first occurrence of each id.
+    """
+    ids = np.zeros(len(locations), dtype=np.int64)
+    for col in locations.columns:
+        codes, uniques = pd.factorize(locations[col])
+        # NaN gets code -1, so shift codes to keep them non-negative.
+        ids, _ = pd.factorize(ids * (len(uniques) + 1) + codes + 1)
+    _, first = np.unique(ids, return_index=True)
+    return ids, first
+
+
+def _align_series(frames, location_cols):
+    """
+    Aligns the wide time series frames on a shared (location, date) integer
+    grid and reshapes them into a single long DataFrame.
+
+    Rows with no positive value in any of the series are dropped, missing
+    values are filled with 0.
+
+    :param frames: dict of wide DataFrames keyed by value name.
+    :param location_cols: columns identifying a location.
+    :return: DataFrame with location_cols, 'Date' and a column per series.
+    """
+    all_locations = pd.concat([df[location_cols] for df in frames.values()],
+                              ignore_index=True)
+    location_ids, first = _location_ids(all_locations)
+
+    date_columns = {name: _date_columns(df) for name, df in frames.items()}
+    all_dates = np.unique(np.concatenate(
+        [dates for _, dates in date_columns.values()]))
+
+    values = {}
+    offset = 0
+    for name, df in frames.items():
+        positions, dates = date_columns[name]
+        grid = np.full((len(first), len(all_dates)), np.nan)
+        rows = location_ids[offset:offset + len(df)]
+        cols = np.searchsorted(all_dates, dates)
+        grid[rows[:, None], cols] = df.iloc[:, positions].to_numpy(float)
+        values[name] = grid
+        offset += len(df)
+
+    # Transposed, so that the rows are ordered by date first.
+    present = np.logical_or.reduce([grid.T > 0 for grid in values.values()])
+    date_idx, location_idx = np.nonzero(present)
+
+    df = all_locations.iloc[first[location_idx]].reset_index(drop=True)
+    df['Date'] = pd.DatetimeIndex(all_dates[date_idx]).strftime('%Y-%m-%d')
+    for name, grid in values.items():
+        column = grid[location_idx, date_idx]
+        column[~(column > 0)] = 0
+        df[name] = pd.array(column.astype(np.int64), dtype='Int64')
+    return df
 
 
 def get_cases_as_df():
@@ -44,12 +137,150 @@ def get_cases_as_df():
     :return: dataframe, each row describes the situation per
     country/province and day.
     """
-    worksheets = [_get_category_df(value_name, url)
-                  for (value_name, url) in _SERIES.items()]
-    merge_columns = list(worksheets[0].columns[:(_TIMESERIES_FIXED_COLS + 1)])
-    df = reduce(partial(pd.merge, how='outer', on=merge_columns), worksheets)
-    for value_name in _SERIES:
-        df[value_name].fillna(0, inplace=True)
+    df = _align_series(_download_series(_SERIES), _LOCATION_COLS)
     df['Epidemy'] = 'Corona'
     add_ISO3_from_name(df, 'Country/Region', 'Other')
     return df
+
+
+def get_us_cases_as_df():
+    """
+    Retrieves the Confirmed and Deaths time series for US counties from the
+    csv files provided by JHU CSSE on GitHub. Joins the information into a
+    single dataframe.
+
+    :return: dataframe, each row describes the situation per county and day.
+    """
+    df = _align_series(_download_series(_US_SERIES), _US_LOCATION_COLS)
+    df['Epidemy'] = 'Corona'
+    df['ISO3'] = df['iso3']
+    return df
+
+
+def stream_us_cases(out_dir, max_cells=_STREAM_MAX_CELLS):
+    """
+    Retrieves the US county-level time series in row chunks and writes them
+    to out_dir as they are processed. The files are read from streaming
+    connections, so memory use depends on max_cells and not on the number of
+    dates in the series.
+
+    Each chunk is written as a part-NNNNN.csv partition with the columns
+    UID, FIPS, ISO3, Date, Confirmed and Deaths. FIPS and ISO3 are resolved
+    through the location mapping kept in locations.csv (keyed by UID, with
+    county, state and population details), which is reused between runs and
+    extended with locations it doesn't know yet.
+
+    The partitions are written to a temporary sibling directory, which
+    replaces out_dir only once all of them are written, so a failed run
+    leaves the previous contents of out_dir intact.
+
+    :param out_dir: directory for the partitions, replaced as a whole.
+    :param max_cells: maximal number of values read per series and chunk;
+    the chunk row count is derived from it and the number of columns.
+    :return: DataFrame with the location mapping, indexed by UID.
+    """
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    locations_path = out_dir / 'locations.csv'
+    if locations_path.exists():
+        locations = pd.read_csv(locations_path, index_col='UID')
+    else:
+        locations = None
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{out_dir.name}-',
+                                    dir=out_dir.parent))
+    try:
+        with ExitStack() as stack:
+            handles = {name: stack.enter_context(urlopen(url))
+                       for name, url in _US_SERIES.items()}
+            headers = {name: next(csv.reader(
+                           [handle.readline().decode('utf-8-sig')]))
+                       for name, handle in handles.items()}
+            rows = max(1, max_cells // max(map(len, headers.values())))
+            readers = [pd.read_csv(handle, header=None, names=headers[name],
+                                   chunksize=rows)
+                       for name, handle in handles.items()]
+
+            for part, chunks in enumerate(zip_longest(*readers)):
+                if any(chunk is None for chunk in chunks):
+                    raise ValueError(
+                        'US time series files are not row-aligned.')
+                chunks = dict(zip(handles, chunks))
+                locations = _update_us_locations(locations, chunks)
+                _write_us_partition(chunks, locations,
+                                    tmp_dir / f'part-{part:05d}.csv')
+
+        locations.to_csv(tmp_dir / 'locations.csv')
+    except BaseException:
+        shutil.rmtree(tmp_dir)
+        raise
+    _replace_dir(tmp_dir, out_dir)
+    return locations
+
+
+def copy_us_partitions(src_dir, out_dir):
+    """
+    Copies partitions written by stream_us_cases to out_dir, replacing it as
+    a whole once the copy is complete.
+    """
+    src_dir, out_dir = Path(src_dir), Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = out_dir.with_name(f'.{out_dir.name}-{uuid4().hex}')
+    try:
+        shutil.copytree(src_dir, tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _replace_dir(tmp_dir, out_dir)
+
+
+def _replace_dir(new_dir, out_dir):
+    if out_dir.exists():
+        old_dir = out_dir.with_name(f'.{out_dir.name}-{uuid4().hex}')
+        out_dir.rename(old_dir)
+        new_dir.rename(out_dir)
+        shutil.rmtree(old_dir)
+    else:
+        new_dir.rename(out_dir)
+
+
+def _update_us_locations(locations, chunks):
+    """
+    Adds the locations of the chunks missing from the locations mapping.
+
+    :param locations: DataFrame indexed by UID or None if there's no mapping
+    yet.
+    :return: DataFrame with the updated mapping.
+    """
+    df = next(iter(chunks.values()))
+    if locations is not None:
+        missing = ~df['UID'].isin(locations.index).to_numpy()
+        if not missing.any():
+            return locations
+    else:
+        missing = np.ones(len(df), dtype=bool)
+
+    new_locations = pd.concat(
+        [df.loc[missing, _fixed_columns(df)] for df in chunks.values()],
+        axis=1)
+    new_locations = new_locations.loc[
+        :, ~new_locations.columns.duplicated()].set_index('UID')
+    new_locations['ISO3'] = new_locations['iso3']
+    return pd.concat([locations, new_locations], sort=False)
+
+
+def _write_us_partition(chunks, locations, path):
+    """
+    Reshapes row-aligned chunks of the US series into the long format,
+    resolves their FIPS and ISO3 codes through locations and writes them to
+    path.
+    """
+    uids = [df['UID'].to_numpy() for df in chunks.values()]
+    if any(not np.array_equal(uids[0], other) for other in uids[1:]):
+        raise ValueError('US time series files are not row-aligned.')
+
+    df = _align_series(chunks, ['UID'])
+    codes = locations.loc[df['UID'], ['FIPS', 'ISO3']]
+    df.insert(1, 'FIPS', codes['FIPS'].to_numpy())
+    df.insert(2, 'ISO3', codes['ISO3'].to_numpy())
+    df.to_csv(path, index=False)
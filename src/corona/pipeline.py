@@ -0,0 +1,58 @@
+import os
+from configparser import ConfigParser
+
+from corona.comparisons import sars_progress, align_epidemic_days
+from corona.epirisk import query_epirisk, per_mil_history
+from corona.projections import project_cases
+from corona.spreadsheets import SpreadsheetsHandler
+from corona.statistics import get_big_numbers, prepare_cases
+
+
+def derive_frames(cases_df):
+    """
+    Creates data for particular Tableau worksheets from the current state of
+    the epidemic.
+
+    :param cases_df: DataFrame with the progress of the Covid-19 epidemic, as
+    returned by corona.hopkins.get_cases_as_df.
+    :return: dict of DataFrames keyed by dataset name.
+    """
+    # - to compare epidemic progress with SARS:
+    final_df, sars_df = sars_progress(cases_df)
+    # - to predict how the current epidemic might keep spreading:
+    connections_df, distribution_df, exported, risk_cases_df = \
+        query_epirisk(cases_df)
+    return {
+        'cases': cases_df,
+        'cases_with_sars': final_df,
+        # - to compare epidemics aligned on days since their start:
+        'epidemics_aligned': align_epidemic_days(final_df),
+        'connections': connections_df,
+        'risks': distribution_df,
+        'exported_cases': exported.df(True),
+        'risk_cases': risk_cases_df,
+        # - to animate the per-million incidence map over time:
+        'per_mil_history': per_mil_history(cases_df),
+        # - to get current statistics:
+        'big_numbers': get_big_numbers(cases_df),
+        # - to project the growth of confirmed cases per country:
+        'projections': project_cases(prepare_cases(cases_df)),
+    }
+
+
+def load_settings(settings_ini):
+    config = ConfigParser()
+    config.read(settings_ini)
+    return config
+
+
+def spreadsheets_handler(config, api_write=True):
+    """
+    Creates a SpreadsheetsHandler with the credentials from config.
+
+    If path to credentials file is not given or empty in config, it's read
+    from the CORONA_READER_CREDENTIALS environment variable.
+    """
+    credentials_file = config['CREDENTIALS'].get(
+        'CORONA_READER_CREDENTIALS') or os.getenv('CORONA_READER_CREDENTIALS')
+    return SpreadsheetsHandler(credentials_file, api_write=api_write)
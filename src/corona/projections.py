@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def project_cases(cases_df, *, key='ISO3', value='Confirmed', window=14,
+                  horizon=7, min_points=5, level=0.95):
+    """
+    Projects the cumulative number of cases a few days ahead for every
+    location, by fitting exponential growth to the most recent days.
+
+    log(value) is fitted with a straight line over the last `window` dates,
+    for all locations at once with stacked arrays (no per-location loop).
+    Growth rates are clipped at 0, as cumulative counts don't decrease.
+    Unrecognized locations ('Other', e.g. cruise ships) are skipped.
+
+    :param cases_df: DataFrame with the progress of the Covid-19 epidemic,
+    e.g. from corona.statistics.prepare_cases.
+    Expected columns: key, value, 'Date'
+    :param key: column identifying a location (country or region).
+    :param value: column with the cumulative counts to project.
+    :param window: number of most recent dates used for the fit.
+    :param horizon: number of days to project.
+    :param min_points: locations with fewer positive values in the window
+    are skipped.
+    :param level: confidence level of the prediction interval. Intervals
+    use Student's t quantiles with n - 2 degrees of freedom, n being the
+    number of points fitted for the location.
+    :return: DataFrame with columns key, 'Date', 'Projected', 'Lower',
+    'Upper' and 'GrowthRate' (daily, exponential), one row per location and
+    projected day.
+    """
+    cases_df = cases_df[cases_df[key] != 'Other']
+    wide = cases_df.pivot_table(index=key, columns='Date', values=value,
+                                aggfunc='sum')
+    wide = wide.sort_index(axis=1).iloc[:, -window:]
+    counts = wide.to_numpy(dtype=float)
+    last_observed = wide.ffill(axis=1).iloc[:, -1].to_numpy(dtype=float)
+
+    # Weighted least squares with 0/1 weights masking out missing values.
+    weights = (counts > 0).astype(float)
+    log_counts = np.log(np.where(counts > 0, counts, 1.0))
+    t = np.arange(counts.shape[1], dtype=float)
+    n = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_mean = (weights * t).sum(axis=1) / n
+        y_mean = (weights * log_counts).sum(axis=1) / n
+        t_dev = (t - t_mean[:, None]) * weights
+        s_tt = (t_dev ** 2).sum(axis=1)
+        slope = (t_dev * (log_counts - y_mean[:, None])).sum(axis=1) / s_tt
+        # The interval is built around the projected line, so residuals are
+        # taken after clipping the slope.
+        slope = np.clip(slope, 0, None)
+        intercept = y_mean - slope * t_mean
+        residuals = weights * (log_counts - intercept[:, None]
+                               - slope[:, None] * t)
+        variance = (residuals ** 2).sum(axis=1) / (n - 2)
+
+    fitted = (n >= max(min_points, 3)) & (s_tt > 0)
+    slope = slope[fitted]
+    intercept = intercept[fitted]
+
+    # Projections for all fitted locations and days, shape (locations, days).
+    t_new = t[-1] + np.arange(1, horizon + 1, dtype=float)
+    log_projected = intercept[:, None] + slope[:, None] * t_new
+    std_error = np.sqrt(variance[fitted][:, None] * (
+        1 + 1 / n[fitted][:, None]
+        + (t_new - t_mean[fitted][:, None]) ** 2 / s_tt[fitted][:, None]))
+    t_quantile = stats.t.ppf((1 + level) / 2, n[fitted] - 2)[:, None]
+    floor = last_observed[fitted][:, None]
+
+    last_date = pd.to_datetime(wide.columns[-1])
+    dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon)
+    projections = pd.DataFrame({
+        key: np.repeat(wide.index[fitted], horizon),
+        'Date': np.tile(dates.strftime('%Y-%m-%d'), fitted.sum()),
+        'Projected': np.maximum(np.exp(log_projected), floor).ravel(),
+        'Lower': np.maximum(np.exp(log_projected - t_quantile * std_error),
+                            floor).ravel(),
+        'Upper': np.maximum(np.exp(log_projected + t_quantile * std_error),
+                            floor).ravel(),
+        'GrowthRate': np.repeat(slope, horizon),
+    })
+    return projections
@@ -0,0 +1,265 @@
+"""
+Local HTTP server for the dashboard datasets.
+
+Keeps the most recent outputs of the pipeline in memory and serves them to
+the Tableau/web front ends, so reads don't go through Google Sheets.
+
+Endpoints:
+    /               - JSON list of available datasets with their ETags
+    /<dataset>      - dataset contents
+
+Query parameters for /<dataset>:
+    format  - 'json' (default), 'csv' or 'arrow' (Arrow IPC stream; needs
+              pyarrow, included in environment.yml)
+    columns - comma separated list of columns to return
+    from    - first date to return (inclusive, YYYY-MM-DD)
+    to      - last date to return (inclusive, YYYY-MM-DD)
+
+Responses carry an ETag and honour If-None-Match. Bodies are gzipped when
+the client accepts it.
+"""
+import gzip
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+_CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+_QUERY_PARAMS = ['format', 'columns', 'from', 'to']
+# Bodies smaller than this are not worth compressing.
+_GZIP_MIN_SIZE = 512
+# Number of encoded responses cached per dataset version.
+_MAX_CACHED_RESPONSES = 32
+
+
+class Dataset:
+    def __init__(self, df, version):
+        """
+        A published DataFrame with its encoded responses.
+
+        Responses are encoded on first request and cached per normalised
+        query and content coding, so repeated reads don't serialise the
+        frame again.
+
+        :param df: DataFrame with the dataset contents.
+        :param version: content hash of df, used in ETags.
+        """
+        self.df = df
+        self.version = version
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def response(self, params, gzipped):
+        """
+        Returns the encoded response for the query params.
+
+        :param params: dict of query parameters, including 'format'.
+        :param gzipped: bool, if the client accepts gzip.
+        :return: (body, etag, gzipped) tuple; gzipped tells if the body was
+        compressed.
+        """
+        query = tuple((k, params[k]) for k in _QUERY_PARAMS if k in params)
+        key = (query, gzipped)
+        with self._lock:
+            if key in self._responses:
+                self._responses.move_to_end(key)
+                return self._responses[key]
+
+        body = _encode_df(_filter_df(self.df, params), params['format'])
+        gzipped = gzipped and len(body) >= _GZIP_MIN_SIZE
+        if gzipped:
+            body = gzip.compress(body, compresslevel=6)
+        # Strong ETags have to differ between content codings.
+        etag = '"{}-{}{}"'.format(
+            self.version,
+            hashlib.sha1(repr(query).encode('utf-8')).hexdigest()[:8],
+            '-gz' if gzipped else '')
+        response = (body, etag, gzipped)
+
+        with self._lock:
+            self._responses[key] = response
+            if len(self._responses) > _MAX_CACHED_RESPONSES:
+                self._responses.popitem(last=False)
+        return response
+
+
+def _frame_version(df):
+    digest = hashlib.sha1()
+    digest.update(','.join(map(str, df.columns)).encode('utf-8'))
+    try:
+        digest.update(pd.util.hash_pandas_object(df, index=False).values)
+    except TypeError:
+        digest.update(df.to_csv(index=False).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class DatasetStore:
+    def __init__(self):
+        """
+        In-memory store of the latest pipeline outputs.
+
+        Readers get an immutable snapshot; publish() builds a new snapshot
+        and swaps it in with a single reference assignment, so reads never
+        wait for a refresh.
+        """
+        self._snapshot: Dict[str, Dataset] = {}
+        self._publish_lock = threading.Lock()
+
+    def publish(self, **frames):
+        """
+        Replaces datasets with new versions. Datasets not given keep their
+        previous contents.
+
+        :param frames: DataFrames keyed by dataset name.
+        """
+        with self._publish_lock:
+            snapshot = dict(self._snapshot)
+            for name, df in frames.items():
+                df = df.reset_index(drop=True)
+                snapshot[name] = Dataset(df, _frame_version(df))
+            self._snapshot = snapshot
+
+    def snapshot(self):
+        return self._snapshot
+
+
+def _accepts_gzip(accept_encoding):
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *options = coding.split(';')
+        quality = 1.0
+        for option in options:
+            key, _, value = option.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def _filter_df(df, params):
+    if ('from' in params or 'to' in params) and 'Date' not in df.columns:
+        raise ValueError('Dataset has no Date column to filter on')
+    if 'from' in params:
+        df = df[df['Date'].astype(str) >= params['from']]
+    if 'to' in params:
+        df = df[df['Date'].astype(str) <= params['to']]
+    if 'columns' in params:
+        columns = params['columns'].split(',')
+        missing = set(columns) - set(df.columns)
+        if missing:
+            raise KeyError(f'Unknown columns: {sorted(missing)}')
+        df = df[columns]
+    return df
+
+
+def _encode_df(df, fmt):
+    if fmt == 'json':
+        return df.to_json(orient='records', date_format='iso').encode('utf-8')
+    elif fmt == 'csv':
+        return df.to_csv(index=False).encode('utf-8')
+    else:
+        sink = io.BytesIO()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+
+
+class DatasetRequestHandler(BaseHTTPRequestHandler):
+    # Set on the subclass created by make_server().
+    store: DatasetStore = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        name = url.path.strip('/')
+        snapshot = self.store.snapshot()
+
+        if not name:
+            index = {k: v.version for k, v in snapshot.items()}
+            self._respond(json.dumps(index).encode('utf-8'),
+                          _CONTENT_TYPES['json'])
+            return
+        if name not in snapshot:
+            self.send_error(HTTPStatus.NOT_FOUND, f'No dataset "{name}"')
+            return
+
+        fmt = params.setdefault('format', 'json')
+        if fmt not in _CONTENT_TYPES:
+            self.send_error(HTTPStatus.BAD_REQUEST, f'Unknown format "{fmt}"')
+            return
+        if fmt == 'arrow' and pa is None:
+            self.send_error(HTTPStatus.NOT_IMPLEMENTED,
+                            'Arrow format requires pyarrow')
+            return
+
+        try:
+            body, etag, gzipped = snapshot[name].response(
+                params, _accepts_gzip(self.headers.get('Accept-Encoding', '')))
+        except (KeyError, ValueError) as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        if etag in self.headers.get('If-None-Match', ''):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        self._respond(body, _CONTENT_TYPES[fmt], etag, gzipped)
+
+    def _respond(self, body, content_type, etag=None, gzipped=False):
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(store, host='127.0.0.1', port=8050):
+    """
+    Creates a threaded HTTP server serving the datasets in store.
+
+    :param store: DatasetStore with the datasets to serve.
+    :param host: interface to bind to.
+    :param port: port to listen on.
+    :return: ThreadingHTTPServer; call serve_forever() to start it.
+    """
+    handler = type('BoundDatasetRequestHandler', (DatasetRequestHandler,),
+                   {'store': store})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_in_background(store, host='127.0.0.1', port=8050):
+    """
+    Starts the server in a daemon thread.
+
+    :return: ThreadingHTTPServer; call shutdown() to stop it.
+    """
+    server = make_server(store, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server